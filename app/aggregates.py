@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+import math
+import datetime
+import collections
+
+
+def _number(value):
+  try:
+    value = float(value)
+  except (TypeError, ValueError):
+    return None
+  if math.isnan(value):
+    return None
+  return value
+
+
+class Moments(object):
+  #running count, sum and sum of squares, enough for mean and SD and cheap to merge
+  def __init__(self):
+    self.count = 0
+    self.total = 0.0
+    self.total_sq = 0.0
+
+  def add(self, value, weight=1):
+    self.count += weight
+    self.total += weight * value
+    self.total_sq += weight * value * value
+
+  def remove(self, value):
+    self.add(value, -1)
+
+  def merge(self, other):
+    self.count += other.count
+    self.total += other.total
+    self.total_sq += other.total_sq
+
+  def mean(self):
+    if self.count < 1:
+      return float("nan")
+    return self.total / self.count
+
+  def std(self):
+    #sample SD like pandas
+    if self.count < 2:
+      return float("nan")
+    var = (self.total_sq - self.total * self.total / self.count) / (self.count - 1)
+    return math.sqrt(max(var, 0.0))
+
+
+class RankSketch(object):
+  #histogram over logarithmic buckets (like DDSketch): quantiles are within
+  #relative_accuracy of the true value, two sketches merge by adding counts
+  #and single values can be removed again
+  def __init__(self, relative_accuracy=0.01):
+    self.relative_accuracy = relative_accuracy
+    self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+    self.log_gamma = math.log(self.gamma)
+    self.positive = collections.Counter()
+    self.negative = collections.Counter()
+    self.zero = 0
+    self.count = 0
+
+  def key(self, value):
+    return int(math.ceil(math.log(value) / self.log_gamma))
+
+  def bucket_value(self, key):
+    return 2 * self.gamma ** key / (self.gamma + 1)
+
+  def add(self, value, weight=1):
+    if value > 0:
+      self.positive[self.key(value)] += weight
+    elif value < 0:
+      self.negative[self.key(-value)] += weight
+    else:
+      self.zero += weight
+    self.count += weight
+
+  def remove(self, value):
+    self.add(value, -1)
+
+  def merge(self, other):
+    self.positive.update(other.positive)
+    self.negative.update(other.negative)
+    self.zero += other.zero
+    self.count += other.count
+
+  def value_at(self, index):
+    #value of the index-th smallest element (from 0), as the middle of its bucket
+    seen = 0
+    for key in sorted(self.negative, reverse=True):
+      seen += self.negative[key]
+      if seen > index:
+        return -self.bucket_value(key)
+    seen += self.zero
+    if seen > index:
+      return 0.0
+    for key in sorted(self.positive):
+      seen += self.positive[key]
+      if seen > index:
+        return self.bucket_value(key)
+    return float("nan")
+
+  def quantile(self, q):
+    #interpolated between the two closest ranks like pandas, so the median of
+    #an even count is the mean of the middle values
+    if self.count < 1:
+      return float("nan")
+    rank = q * (self.count - 1)
+    lower = self.value_at(math.floor(rank))
+    upper = self.value_at(math.ceil(rank))
+    return lower + (upper - lower) * (rank - math.floor(rank))
+
+
+class TrendStore(object):
+  #per bucket and group aggregates of the task results, a participant is added
+  #(or replaced) when one of their files changes, so an update only touches
+  #the changed participants and never the whole survey
+  def __init__(self, cols, bucket_size=10, relative_accuracy=0.01):
+    self.cols = cols
+    self.bucket_size = bucket_size
+    self.relative_accuracy = relative_accuracy
+    self.buckets = {"day": {}, "participants": {}}
+    self.participants = {}
+    self.ordinals = {}
+
+  def bucket_keys(self, participant):
+    return {"day": participant["day"],
+            "participants": participant["ordinal"] // self.bucket_size}
+
+  def bucket_label(self, mode, key):
+    if mode == "participants":
+      return "{}-{}".format(key * self.bucket_size + 1, (key + 1) * self.bucket_size)
+    return key
+
+  def apply(self, participant, remove=False):
+    for mode, key in self.bucket_keys(participant).items():
+      bucket = self.buckets[mode].setdefault(key, {})
+      for col, value in participant["values"].items():
+        stats = bucket.get((participant["group"], col))
+        if stats is None:
+          stats = bucket[(participant["group"], col)] = (Moments(), RankSketch(self.relative_accuracy))
+        for stat in stats:
+          if remove:
+            stat.remove(value)
+          else:
+            stat.add(value)
+
+  def update(self, survey_df, user_ids, arrivals):
+    #user_ids are the participants with new, changed or deleted files
+    for user_id in user_ids:
+      participant = self.participants.pop(user_id, None)
+      if participant is not None:
+        self.apply(participant, remove=True)
+
+    if not user_ids or len(survey_df) == 0 or "group" not in survey_df.columns:
+      return
+    changed = survey_df[survey_df.index.astype(str).isin(user_ids)]
+    cols = [col for col in self.cols if col in changed.columns]
+    #new participants are numbered in the order their first file arrived
+    labels = sorted(changed.index, key=lambda label: arrivals.get(str(label), 0))
+    for label in labels:
+      user_id = str(label)
+      group = changed.at[label, "group"]
+      if group not in ["Test", "Control"]:
+        continue
+      values = {}
+      for col in cols:
+        value = _number(changed.at[label, col])
+        if value is not None:
+          values[col] = value
+      if user_id not in self.ordinals:
+        self.ordinals[user_id] = len(self.ordinals)
+      arrival = arrivals.get(user_id, 0)
+      participant = {"group": group,
+                     "day": datetime.date.fromtimestamp(arrival / 1e9).isoformat(),
+                     "ordinal": self.ordinals[user_id],
+                     "values": values}
+      self.participants[user_id] = participant
+      self.apply(participant)
+
+  def cumulative(self, mode, group, col):
+    #count, mean, SD and median of all participants up to and including each bucket
+    moments = Moments()
+    sketch = RankSketch(self.relative_accuracy)
+    rows = []
+    for key in sorted(self.buckets[mode]):
+      stats = self.buckets[mode][key].get((group, col))
+      if stats is not None:
+        moments.merge(stats[0])
+        sketch.merge(stats[1])
+      rows.append({"bucket": self.bucket_label(mode, key),
+                   "N": moments.count,
+                   "mean": moments.mean(),
+                   "SD": moments.std(),
+                   "median": sketch.quantile(0.5)})
+    return rows
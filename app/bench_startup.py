@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+#measures how long a fresh dashboard process needs until /healthz answers
+#(readiness), until the layout is served and until the data is warmed up
+#
+#  python bench_startup.py --runs 5 --budget 10
+#
+#exits with 1 if any run took longer than --budget seconds to become ready
+#or the dashboard reported that warming a study failed
+import os
+import sys
+import time
+import argparse
+import subprocess
+import statistics
+import urllib.request
+import urllib.error
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def get(url):
+  try:
+    with urllib.request.urlopen(url, timeout=1) as response:
+      return response.status, response.read()
+  except urllib.error.HTTPError as e:
+    return e.code, e.read()
+  except (urllib.error.URLError, ConnectionError, OSError):
+    return None, b""
+
+def measure_run(port, timeout, env):
+  start = time.time()
+  process = subprocess.Popen([sys.executable, os.path.join(HERE, "dashboard.py")],
+                             cwd=HERE,
+                             env=env,
+                             stdout=subprocess.DEVNULL,
+                             stderr=subprocess.DEVNULL)
+  base = "http://127.0.0.1:{}".format(port)
+  timings = {"ready": None, "layout": None, "warm": None, "failed": False}
+  #without WARM_START the data is only loaded by the first request, stop once the layout is served
+  last = "layout" if env.get("WARM_START") == "0" else "warm"
+  try:
+    while time.time() - start < timeout and timings[last] is None:
+      if process.poll() is not None:
+        raise RuntimeError("dashboard exited with code {}".format(process.returncode))
+      status, body = get(base + "/healthz")
+      now = time.time() - start
+      if status is not None and timings["ready"] is None:
+        timings["ready"] = now
+      if body == b"failed":
+        timings["failed"] = True
+        break
+      if status == 200:
+        if timings["layout"] is None and get(base + "/_dash-layout")[0] == 200:
+          timings["layout"] = time.time() - start
+        if body == b"warm":
+          timings["warm"] = now
+      time.sleep(0.05)
+  finally:
+    process.terminate()
+    process.wait()
+  return timings
+
+def summary(values):
+  values = [value for value in values if value is not None]
+  if not values:
+    return "n/a"
+  return "median {:.2f}s  max {:.2f}s".format(statistics.median(values), max(values))
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--runs", type=int, default=5)
+  parser.add_argument("--port", type=int, default=8050)
+  parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for a single run")
+  parser.add_argument("--budget", type=float, default=10, help="maximum seconds until ready")
+  parser.add_argument("--studies", default=None, help="STUDIES for the dashboard, defaults to the environment")
+  args = parser.parse_args()
+
+  env = dict(os.environ, PORT=str(args.port), DEBUG="0")
+  if args.studies is not None:
+    env["STUDIES"] = args.studies
+
+  runs = []
+  for run in range(args.runs):
+    timings = measure_run(args.port, args.timeout, env)
+    runs.append(timings)
+    print("run {}: ready {}  layout {}  warm {}".format(
+      run + 1,
+      *["{:.2f}s".format(timings[key]) if timings[key] is not None else "n/a" for key in ["ready", "layout", "warm"]]))
+    if timings["failed"]:
+      print("run {}: warming failed".format(run + 1))
+
+  print("ready   {}".format(summary([timings["ready"] for timings in runs])))
+  print("layout  {}".format(summary([timings["layout"] for timings in runs])))
+  print("warm    {}".format(summary([timings["warm"] for timings in runs])))
+
+  failed = False
+  if any(timings["failed"] for timings in runs):
+    print("warming failed")
+    failed = True
+  if any(timings["ready"] is None or timings["ready"] > args.budget for timings in runs):
+    print("not ready within {:.1f}s".format(args.budget))
+    failed = True
+  if failed:
+    sys.exit(1)
+
+if __name__ == '__main__':
+  main()
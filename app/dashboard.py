@@ -3,266 +3,390 @@ import dash
 import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output, State
-import dash_table
-import plotly.graph_objs as go
 import pandas as pd
 import numpy as np
 import os
+import sys
+import json
 import math
-from scipy.stats import mannwhitneyu, ttest_ind
+import threading
+import itertools
+import collections
+from flask import Response, abort, request
+#dash_table, plotly.graph_objs and scipy.stats are slow to import, they are
+#imported where they are used so the layout can be served right after start
 from nutris import nutris
+from aggregates import TrendStore
+from validation import issue, validate_file, validate_study
+from selections import SelectionIndex
 
 BASEPATH = "/data"
 
+#upper bound for the cached frames and rendered sections of all studies together, idle
+#studies are evicted first. the trend stores and selection indexes only hold counts per
+#bucket and per selection and are not counted
+STUDY_CACHE_BYTES = int(os.environ.get("STUDY_CACHE_BYTES", 512 * 1024 * 1024))
+
+#load and render every study in the background right after start instead of on the first request
+WARM_START = os.environ.get("WARM_START", "1") == "1"
+
+DEBUG = os.environ.get("DEBUG", "1") == "1"
+
+#columns derived per task from the machine layout, nutris and trackings
+TASK_COLS = ["nutri_label",
+             "nutri_score",
+             "energy",
+             "sugar",
+             "sat_fat",
+             "natrium",
+             "protein",
+             "fiber",
+             "health_percentage",
+             "time"]
+
+EXPORT_CHUNK_ROWS = 500
+
+#task results followed over the course of the study, per day or per TREND_BUCKET_SIZE participants
+TREND_COLS = ["nutri_score",
+              "health_percentage",
+              "time"]
+TREND_BUCKET_SIZE = 10
+
+def parse_studies(spec):
+  #"name=/path,other=/other/path", a plain path serves a single study called "default"
+  studies = collections.OrderedDict()
+  for item in spec.split(","):
+    if "=" in item:
+      name, path = item.split("=", 1)
+    else:
+      name, path = "default", item
+    studies[name.strip()] = path.strip()
+  return studies
+
+STUDIES = parse_studies(os.environ.get("STUDIES", BASEPATH))
+
 app = dash.Dash(__name__)
 app.config['suppress_callback_exceptions']=True
 
 
-def combine_all_data():
+def file_kind(filename):
+  if not ".csv" in filename:
+    return None
+  if "machineLayout" in filename:
+    return "machineLayout"
+  if "_trackings_" in filename:
+    return "trackings"
+  if "BAK" in filename:
+    return None
+  for kind in ["evaluation", "basic", "guess", "task"]:
+    if "_{}_".format(kind) in filename:
+      return kind
+  return None
+
+def read_data_file(path, filename, kind):
+  #returns the parsed file and the validation issues found in it
+  user_id = filename.split("_")[0]
+  task = filename.split("_")[1]
+  try:
+    if kind == "trackings":
+      df = pd.read_csv(path, sep=',')
+    elif kind == "machineLayout":
+      df = pd.read_csv(path, sep=';')
+    else:
+      df = pd.read_csv(path, index_col="user_id", sep=';')
+  except ValueError as e:
+    #also covers empty files and broken csv
+    return pd.DataFrame(), [issue("unreadable file", 0, str(e), filename, kind)]
+  issues = validate_file(filename, kind, df, CATEGORIES, NUTRI_IDS)
+
+  if kind == "machineLayout":
+    #the machinelayout is the same for all tasks no need to store it multiple times
+    #extract the machine layout
+    df["user_id"] = user_id
+    df["task"] = task
+  elif kind == "trackings":
+    if len(df) == 0 or not "timestamp" in df.columns:
+      return pd.DataFrame(columns=["user_id", "task", "time"]), issues
+    #a broken timestamp leaves the time empty, it is reported by validate_file
+    timestamp = pd.to_numeric(df["timestamp"], errors="coerce").iloc[-1]
+    df = pd.DataFrame([{"user_id":user_id, "task":task, "time":timestamp / 1000}])
+  return df, issues
+
+def ingest_files(study):
+  #only files that are new or changed since the last refresh are read again,
+  #returns the user_ids of all participants whose files changed
+  files = study["files"]
+  user_files = study["user_files"]
+  arrivals = study["arrivals"]
+  seen = set()
+  changed = set()
+  for entry in os.scandir(study["basepath"]):
+    kind = file_kind(entry.name)
+    if kind is None:
+      continue
+    stat = entry.stat()
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    seen.add(entry.name)
+    if entry.name not in files or files[entry.name]["stamp"] != stamp:
+      df, issues = read_data_file(entry.path, entry.name, kind)
+      files[entry.name] = {"stamp": stamp,
+                           "kind": kind,
+                           "df": df,
+                           "issues": issues}
+      user_id = entry.name.split("_")[0]
+      changed.add(user_id)
+      user_files.setdefault(user_id, set()).add(entry.name)
+      #a participant arrives with their first file
+      arrivals[user_id] = min(arrivals.get(user_id, stat.st_mtime_ns), stat.st_mtime_ns)
+  for filename in set(files) - seen:
+    del files[filename]
+    user_id = filename.split("_")[0]
+    changed.add(user_id)
+    user_files[user_id].discard(filename)
+  return changed
+
+AGE_CLASSES = {
+  0: "0.) < 19yrs",
+  1: "1.) 20 - 29 yrs",
+  2: "2.) 30 - 49 yrs",
+  3: "2.) 30 - 49 yrs",
+  4: "3.) 50 - 65 yrs",
+  5: "4.) > 65 yrs",
+  6: "4.) > 65 yrs"}
+
+AGES = {
+  0: 18,
+  1: 25,
+  2: 35,
+  2: 45,
+  3: 57,
+  4: 72,
+  5: 85
+}
+
+WEIGHTS = {
+  "39-": 35,
+  "40-49": 45,
+  "50-59": 55,
+  "60-69": 65,
+  "70-79": 75,
+  "80-89": 85,
+  "90-99": 95,
+  "100-109": 105,
+  "110-119": 115,
+  "120-129": 125,
+  "130-139": 135,
+  "140-149": 145,
+  "150+": 155
+}
+
+HEIGHTS = {
+  "139-": 1.35,
+  "140-149": 1.45,
+  "150-159": 1.55,
+  "160-169": 1.65,
+  "170-179": 1.75,
+  "180-189": 1.85,
+  "190-199": 1.95,
+  "200-209": 2.05,
+  "210+": 2.15
+}
+
+GENDERS = {
+  "male": "0.) Male",
+  "female": "1.)Female"
+}
+
+DIETS = {
+  "No I don't follow a certain diet": "None",
+  "Nein, ich folge keiner bestimmten Diät": "None",
+  "I avoid certain foods because of an allergy or food intolerance": "Allergy / Intolerance",
+  "Ich vermeide bestimmte Lebensmittel wegen Allergie oder Unverträglichkeit": "Allergy / Intolerance",
+  "I eat vegetarian": "Vegiatrian / Vegan",
+  "Ich esse vegetarisch (ovo-lacto-vegetarisch, lacto-vegetarisch)": "Vegiatrian / Vegan",
+  "I eat vegan": "Vegiatrian / Vegan",
+  "Ich esse vegan": "Vegiatrian / Vegan",
+  "I avoid certain foods for ethical/cultural/religious reasons": "Cultural / Ethnical",
+  "Ich vermeide bestimmte Lebensmittel aus ethischen, kulturellen oder religiösen Gründen": "Cultural / Ethnical",
+  "I follow a high carbohydrate diet": "High Carb",
+  "Ich esse kohlenhydratreich": "High Carb",
+  "I follow a diet low in carbohydrates": "Low Carb",
+  "Ich esse kohlenhydrat-arm": "Low Carb",
+  "I follow a low fat or cholosterol diet": "Low Fat",
+  "Ich esse fettarm oder cholesterin-arm": "Low Fat",
+  "I follow a diet with reduced salt consumption": "Low Salt",
+  "Ich esse salz-reduziert": "Low Salt",
+  "I follow a diet low in protein": "Low Protein",
+  "Ich esse protein-arm": "Low Protein",
+  "I follow a diet rich in protein": "High Protein",
+  "Ich esse protein-reich": "High Protein",
+  "I follow an environmentally friendly / sustainable diet": "Sustainable",
+  "Ich ernähre mich umweltreundlich und nachhaltig": "Sustainable",
+}
+
+EDUCATIONS = {
+  "Manditory School": "0:) primary education",
+  "Middle school": "0:) primary education",
+  "High school": "1.) secondary education",
+  "Vocational school": "1.) secondary education",
+  "master's diploma": "2.) tertiary education",
+  "College / University": "2.) tertiary education",
+  "Obligatorische Schule": "0:) primary education",
+  "Weiterführende Schule": "0:) primary education",
+  "Matura": "1.) secondary education",
+  "Berufsschule": "1.) secondary education",
+  "Meister- / eidg. Diplom": "2.) tertiary education",
+  "Studium": "2.) tertiary education",
+}
+
+SNACK_FREQUENCIES = {
+  "sehr selten bis nie": "0.) never",
+  "never":"0.) never",
+  "once or twice per year":"0.) never",
+  "ca. monatlich":"1.) monthly",
+  "monthly":"1.) monthly",
+  "ca. wöchentlich":"2.) weekly",
+  "weekly":"2.) weekly",
+  "ca. 2-3 mal pro Woche":"2.) weekly",
+  "ca. 4-5 mal pro Woche":"3.) almost daily",
+  "daily":"3.) almost daily",
+  "ca. täglich":"3.) almost daily",
+}
+
+SNACK_FREQUENCIES_INT = {
+  "sehr selten bis nie": 0,
+  "never":0,
+  "once or twice per year":0,
+  "ca. monatlich":1,
+  "monthly":1,
+  "ca. wöchentlich":4,
+  "weekly":4,
+  "ca. 2-3 mal pro Woche":10,
+  "ca. 4-5 mal pro Woche":20,
+  "daily":31,
+  "ca. täglich":31,
+}
+
+AR_FREQUENCIES = {
+  "Never used":"0.) Never",
+  "Noch nie benutz":"0.) Never",
+  "Tried once or twice":"1.) Few Times",
+  "Schon ein oder zwei Mal benutzt":"1.) Few Times",
+  "I use it sometimes":"2.) Sometimes",
+  "Ich benutze es hin und wieder privat":"2.) Sometimes",
+  "I worked with it on a project":"3.) Regularly",
+  "Ich habe an einem Projekt damit gearbeitet":"3.) Regularly",
+  "I use it regularly for private purpose":"3.) Regularly",
+  "Ich benutze es regelmäßig privat":"3.) Regularly",
+  "It is part of my job on a regular basis":"3.) Regularly",
+  "Ich komme auf der Arbeit regelmäßig damit in Kontakt":"3.) Regularly",
+  "I am an expert / developer in the field":"4.) Expert",
+  "Ich bin ein Experte / Entwickler auf dem Feld":"4.) Expert",
+}
+
+AR_FREQUENCIES_INT = {
+  "Never used":0,
+  "Noch nie benutz":0,
+  "Tried once or twice":1,
+  "Schon ein oder zwei Mal benutzt":1,
+  "I use it sometimes":2,
+  "Ich benutze es hin und wieder privat":2,
+  "I worked with it on a project":3,
+  "Ich habe an einem Projekt damit gearbeitet":3,
+  "I use it regularly for private purpose":3,
+  "Ich benutze es regelmäßig privat":3,
+  "It is part of my job on a regular basis":3,
+  "Ich komme auf der Arbeit regelmäßig damit in Kontakt":3,
+  "I am an expert / developer in the field":4,
+  "Ich bin ein Experte / Entwickler auf dem Feld":4,
+}
+
+#answers that are mapped in combine_all_data, anything else is reported by the validation
+CATEGORIES = {
+  "age": (AGES, True),
+  "weight": (WEIGHTS, False),
+  "height": (HEIGHTS, False),
+  "gender": (GENDERS, False),
+  "diet": (DIETS, False),
+  "education": (EDUCATIONS, False),
+  "snack_frequency": (SNACK_FREQUENCIES, False),
+  "ar_frequency": (AR_FREQUENCIES, False),
+}
+
+NUTRI_IDS = list(nutris)
+
+def combine_all_data(files):
   print("getting new data")
   survey_df = pd.DataFrame()
-  #tracking_files = {}
-  machineLayouts = pd.DataFrame()
-  timings = pd.DataFrame()
-
-  for filename in os.listdir(BASEPATH):
-    if ".csv" in filename:
-      if "machineLayout" in filename:
-        user_id = filename.split("_")[0]
-        task = filename.split("_")[1]
-        #the machinelayout is the same for all tasks no need to store it multiple times
-        #extract the machine layout
-        machinelayout_df_tmp = pd.read_csv(os.path.join(BASEPATH, filename), sep=';')
-        machinelayout_df_tmp["user_id"] = user_id
-        machinelayout_df_tmp["task"] = task
-        machineLayouts = machineLayouts.append(machinelayout_df_tmp, ignore_index=True)
-      if "_trackings_" in filename:
-        user_id = filename.split("_")[0]
-        task = filename.split("_")[1]
-        timings_df_tmp = pd.read_csv(os.path.join(BASEPATH, filename), sep=',')
-        timings = timings.append({"user_id":user_id, "task":task, "time":timings_df_tmp.iloc[-1]["timestamp"] / 1000}, ignore_index=True)
-
-  for filename in os.listdir(BASEPATH):
-    if ".csv" in filename and not "BAK" in filename:
-      if "_evaluation_" in filename:
-        survey_df_tmp = pd.read_csv(os.path.join(BASEPATH, filename), index_col="user_id", sep=';')
-        survey_df = survey_df_tmp.combine_first(survey_df)
-      elif "_basic_" in filename:
-        survey_df_tmp = pd.read_csv(os.path.join(BASEPATH, filename), index_col="user_id", sep=';')
-        survey_df = survey_df_tmp.combine_first(survey_df)
-      elif "_guess_" in filename:
-        survey_df_tmp = pd.read_csv(os.path.join(BASEPATH, filename), index_col="user_id", sep=';')
-        survey_df = survey_df_tmp.combine_first(survey_df)
-      elif "_task_" in filename:
-        #extract the nutriscore & label from machine layout if available
-        survey_df_tmp = pd.read_csv(os.path.join(BASEPATH, filename), index_col="user_id", sep=';')
-        user_id = str(survey_df_tmp.index[0])
-        #assuming there is only one row in the survey_task.csv, which is fine if data from typeform
-        for taskNr in range(1,5):
-          try:
-            product = machineLayouts[ (machineLayouts["user_id"] == user_id) & \
-                                      (machineLayouts["BoxNr"] == int(survey_df_tmp["t_{}".format(taskNr)].iloc[0]))
-                                      ].iloc[0]
-            survey_df_tmp["nutri_label_{}".format(taskNr)] = product["ProductNutriLabel"]
-            survey_df_tmp["nutri_score_{}".format(taskNr)] = product["ProductNutriScore"]
-            survey_df_tmp["energy_{}".format(taskNr)] = nutris[product["ProductId"]]["energy"]
-            survey_df_tmp["sugar_{}".format(taskNr)] = nutris[product["ProductId"]]["sugar"]
-            survey_df_tmp["sat_fat_{}".format(taskNr)] = nutris[product["ProductId"]]["sat_fat"]
-            survey_df_tmp["natrium_{}".format(taskNr)] = nutris[product["ProductId"]]["natrium"]
-            survey_df_tmp["protein_{}".format(taskNr)] = nutris[product["ProductId"]]["protein"]
-            survey_df_tmp["fiber_{}".format(taskNr)]= nutris[product["ProductId"]]["fiber"]
-            survey_df_tmp["health_percentage_{}".format(taskNr)] = nutris[product["ProductId"]]["health_percentage"]
-            survey_df_tmp["time_{}".format(taskNr)] = timings.loc[(timings["user_id"]==user_id) & (timings["task"]==str(taskNr)),"time"].iloc[0]
-          except:
-            survey_df_tmp["nutri_label_{}".format(taskNr)] = None
-            survey_df_tmp["nutri_score_{}".format(taskNr)] = None
-            survey_df_tmp["energy_{}".format(taskNr)] = None
-            survey_df_tmp["sugar_{}".format(taskNr)] = None
-            survey_df_tmp["sat_fat_{}".format(taskNr)] = None
-            survey_df_tmp["natrium_{}".format(taskNr)] = None
-            survey_df_tmp["protein_{}".format(taskNr)] = None
-            survey_df_tmp["fiber_{}".format(taskNr)]= None
-            survey_df_tmp["health_percentage_{}".format(taskNr)] = None
-            survey_df_tmp["time_{}".format(taskNr)] = None                                                   
-        survey_df = survey_df_tmp.combine_first(survey_df)
-
-  age_classes = {
-    0: "0.) < 19yrs",
-    1: "1.) 20 - 29 yrs",
-    2: "2.) 30 - 49 yrs",
-    3: "2.) 30 - 49 yrs",
-    4: "3.) 50 - 65 yrs",
-    5: "4.) > 65 yrs",
-    6: "4.) > 65 yrs"}
-
-  survey_df["age_class"] = survey_df["age"].apply(lambda x: safe_dict(x, age_classes))
-
-  ages = {
-    0: 18,
-    1: 25,
-    2: 35,
-    2: 45,
-    3: 57,
-    4: 72,
-    5: 85
-  }
-  survey_df["age"] = survey_df["age"].apply(lambda x: safe_dict(x, ages))
-
-  weights = {
-    "39-": 35,
-    "40-49": 45,
-    "50-59": 55,
-    "60-69": 65,
-    "70-79": 75,
-    "80-89": 85,
-    "90-99": 95,
-    "100-109": 105,
-    "110-119": 115,
-    "120-129": 125,
-    "130-139": 135,
-    "140-149": 145,
-    "150+": 155
-  }
-  survey_df["weight"] = survey_df["weight"].apply(lambda x: safe_dict(x, weights, False))
-
-  heights = {
-    "139-": 1.35,
-    "140-149": 1.45,
-    "150-159": 1.55,
-    "160-169": 1.65,
-    "170-179": 1.75,
-    "180-189": 1.85,
-    "190-199": 1.95,
-    "200-209": 2.05,
-    "210+": 2.15
-  }
-
-  survey_df["height"] = survey_df["height"].apply(lambda x: safe_dict(x, heights, False))
-
-  genders = {
-    "male": "0.) Male",
-    "female": "1.)Female"
-  }
-
-  survey_df["gender"] = survey_df["gender"].apply(lambda x: safe_dict(x, genders, False))
+  filenames = sorted(files)
+
+  layouts = [files[filename]["df"] for filename in filenames if files[filename]["kind"] == "machineLayout"]
+  machineLayouts = pd.concat(layouts, ignore_index=True) if layouts else pd.DataFrame()
+  trackings = [files[filename]["df"] for filename in filenames if files[filename]["kind"] == "trackings"]
+  timings = pd.concat(trackings, ignore_index=True) if trackings else pd.DataFrame()
+
+  for filename in filenames:
+    kind = files[filename]["kind"]
+    if kind in ["evaluation", "basic", "guess"]:
+      survey_df = files[filename]["df"].combine_first(survey_df)
+    elif kind == "task" and len(files[filename]["df"]):
+      #extract the nutriscore & label from machine layout if available
+      #the cached frame is reused on the next refresh, add the task columns to a copy
+      survey_df_tmp = files[filename]["df"].copy()
+      user_id = str(survey_df_tmp.index[0])
+      #assuming there is only one row in the survey_task.csv, which is fine if data from typeform
+      for taskNr in range(1,5):
+        try:
+          product = machineLayouts[ (machineLayouts["user_id"] == user_id) & \
+                                    (machineLayouts["BoxNr"] == int(survey_df_tmp["t_{}".format(taskNr)].iloc[0]))
+                                    ].iloc[0]
+          survey_df_tmp["nutri_label_{}".format(taskNr)] = product["ProductNutriLabel"]
+          survey_df_tmp["nutri_score_{}".format(taskNr)] = product["ProductNutriScore"]
+          survey_df_tmp["energy_{}".format(taskNr)] = nutris[product["ProductId"]]["energy"]
+          survey_df_tmp["sugar_{}".format(taskNr)] = nutris[product["ProductId"]]["sugar"]
+          survey_df_tmp["sat_fat_{}".format(taskNr)] = nutris[product["ProductId"]]["sat_fat"]
+          survey_df_tmp["natrium_{}".format(taskNr)] = nutris[product["ProductId"]]["natrium"]
+          survey_df_tmp["protein_{}".format(taskNr)] = nutris[product["ProductId"]]["protein"]
+          survey_df_tmp["fiber_{}".format(taskNr)]= nutris[product["ProductId"]]["fiber"]
+          survey_df_tmp["health_percentage_{}".format(taskNr)] = nutris[product["ProductId"]]["health_percentage"]
+          survey_df_tmp["time_{}".format(taskNr)] = timings.loc[(timings["user_id"]==user_id) & (timings["task"]==str(taskNr)),"time"].iloc[0]
+        except (IndexError, KeyError, ValueError, TypeError):
+          #no matching box, product or tracking, reported by validate_study
+          survey_df_tmp["nutri_label_{}".format(taskNr)] = None
+          survey_df_tmp["nutri_score_{}".format(taskNr)] = None
+          survey_df_tmp["energy_{}".format(taskNr)] = None
+          survey_df_tmp["sugar_{}".format(taskNr)] = None
+          survey_df_tmp["sat_fat_{}".format(taskNr)] = None
+          survey_df_tmp["natrium_{}".format(taskNr)] = None
+          survey_df_tmp["protein_{}".format(taskNr)] = None
+          survey_df_tmp["fiber_{}".format(taskNr)]= None
+          survey_df_tmp["health_percentage_{}".format(taskNr)] = None
+          survey_df_tmp["time_{}".format(taskNr)] = None
+      survey_df = survey_df_tmp.combine_first(survey_df)
+
+  survey_df["age_class"] = survey_df["age"].apply(lambda x: safe_dict(x, AGE_CLASSES))
+
+  survey_df["age"] = survey_df["age"].apply(lambda x: safe_dict(x, AGES))
+
+  survey_df["weight"] = survey_df["weight"].apply(lambda x: safe_dict(x, WEIGHTS, False))
+
+  survey_df["height"] = survey_df["height"].apply(lambda x: safe_dict(x, HEIGHTS, False))
+
+  survey_df["gender"] = survey_df["gender"].apply(lambda x: safe_dict(x, GENDERS, False))
 
   survey_df["bmi"] = survey_df["weight"] / (survey_df["height"] * survey_df["height"])
 
   survey_df["bmi_class"] = survey_df["bmi"].apply(bmi_class)
 
-  diets = {
-    "No I don't follow a certain diet": "None",
-    "Nein, ich folge keiner bestimmten Diät": "None",
-    "I avoid certain foods because of an allergy or food intolerance": "Allergy / Intolerance",
-    "Ich vermeide bestimmte Lebensmittel wegen Allergie oder Unverträglichkeit": "Allergy / Intolerance",
-    "I eat vegetarian": "Vegiatrian / Vegan",
-    "Ich esse vegetarisch (ovo-lacto-vegetarisch, lacto-vegetarisch)": "Vegiatrian / Vegan",
-    "I eat vegan": "Vegiatrian / Vegan",
-    "Ich esse vegan": "Vegiatrian / Vegan",
-    "I avoid certain foods for ethical/cultural/religious reasons": "Cultural / Ethnical",
-    "Ich vermeide bestimmte Lebensmittel aus ethischen, kulturellen oder religiösen Gründen": "Cultural / Ethnical",
-    "I follow a high carbohydrate diet": "High Carb",
-    "Ich esse kohlenhydratreich": "High Carb",
-    "I follow a diet low in carbohydrates": "Low Carb",
-    "Ich esse kohlenhydrat-arm": "Low Carb",
-    "I follow a low fat or cholosterol diet": "Low Fat",
-    "Ich esse fettarm oder cholesterin-arm": "Low Fat",
-    "I follow a diet with reduced salt consumption": "Low Salt",
-    "Ich esse salz-reduziert": "Low Salt",
-    "I follow a diet low in protein": "Low Protein",
-    "Ich esse protein-arm": "Low Protein",
-    "I follow a diet rich in protein": "High Protein",
-    "Ich esse protein-reich": "High Protein",
-    "I follow an environmentally friendly / sustainable diet": "Sustainable",
-    "Ich ernähre mich umweltreundlich und nachhaltig": "Sustainable",
-  }
-
-  survey_df["diet"] = survey_df["diet"].apply(lambda x: safe_dict(x, diets, False))
-
-  educations = {
-    "Manditory School": "0:) primary education",
-    "Middle school": "0:) primary education",
-    "High school": "1.) secondary education",
-    "Vocational school": "1.) secondary education",
-    "master's diploma": "2.) tertiary education",
-    "College / University": "2.) tertiary education",
-    "Obligatorische Schule": "0:) primary education",
-    "Weiterführende Schule": "0:) primary education",
-    "Matura": "1.) secondary education",
-    "Berufsschule": "1.) secondary education",
-    "Meister- / eidg. Diplom": "2.) tertiary education",
-    "Studium": "2.) tertiary education",
-  }
-
-  survey_df["education"] = survey_df["education"].apply(lambda x: safe_dict(x, educations, False))
-
-  snack_frequencies = {
-    "sehr selten bis nie": "0.) never",
-    "never":"0.) never",
-    "once or twice per year":"0.) never",
-    "ca. monatlich":"1.) monthly",
-    "monthly":"1.) monthly",
-    "ca. wöchentlich":"2.) weekly",
-    "weekly":"2.) weekly",
-    "ca. 2-3 mal pro Woche":"2.) weekly",
-    "ca. 4-5 mal pro Woche":"3.) almost daily",
-    "daily":"3.) almost daily",
-    "ca. täglich":"3.) almost daily",
-  }
-
-  snack_frequencies_int = {
-    "sehr selten bis nie": 0,
-    "never":0,
-    "once or twice per year":0,
-    "ca. monatlich":1,
-    "monthly":1,
-    "ca. wöchentlich":4,
-    "weekly":4,
-    "ca. 2-3 mal pro Woche":10,
-    "ca. 4-5 mal pro Woche":20,
-    "daily":31,
-    "ca. täglich":31,
-  }
+  survey_df["diet"] = survey_df["diet"].apply(lambda x: safe_dict(x, DIETS, False))
 
-  survey_df["snack_frequency_int"] = survey_df["snack_frequency"].apply(lambda x: safe_dict(x, snack_frequencies_int, False))
-  survey_df["snack_frequency"] = survey_df["snack_frequency"].apply(lambda x: safe_dict(x, snack_frequencies, False))
-
-  ar_frequencies = {
-    "Never used":"0.) Never",
-    "Noch nie benutz":"0.) Never",
-    "Tried once or twice":"1.) Few Times",
-    "Schon ein oder zwei Mal benutzt":"1.) Few Times",
-    "I use it sometimes":"2.) Sometimes",
-    "Ich benutze es hin und wieder privat":"2.) Sometimes",
-    "I worked with it on a project":"3.) Regularly",
-    "Ich habe an einem Projekt damit gearbeitet":"3.) Regularly",
-    "I use it regularly for private purpose":"3.) Regularly",
-    "Ich benutze es regelmäßig privat":"3.) Regularly",
-    "It is part of my job on a regular basis":"3.) Regularly",
-    "Ich komme auf der Arbeit regelmäßig damit in Kontakt":"3.) Regularly",
-    "I am an expert / developer in the field":"4.) Expert",
-    "Ich bin ein Experte / Entwickler auf dem Feld":"4.) Expert",
-  }
+  survey_df["education"] = survey_df["education"].apply(lambda x: safe_dict(x, EDUCATIONS, False))
 
-  ar_frequencies_int = {
-    "Never used":0,
-    "Noch nie benutz":0,
-    "Tried once or twice":1,
-    "Schon ein oder zwei Mal benutzt":1,
-    "I use it sometimes":2,
-    "Ich benutze es hin und wieder privat":2,
-    "I worked with it on a project":3,
-    "Ich habe an einem Projekt damit gearbeitet":3,
-    "I use it regularly for private purpose":3,
-    "Ich benutze es regelmäßig privat":3,
-    "It is part of my job on a regular basis":3,
-    "Ich komme auf der Arbeit regelmäßig damit in Kontakt":3,
-    "I am an expert / developer in the field":4,
-    "Ich bin ein Experte / Entwickler auf dem Feld":4,
-  }
+  survey_df["snack_frequency_int"] = survey_df["snack_frequency"].apply(lambda x: safe_dict(x, SNACK_FREQUENCIES_INT, False))
+  survey_df["snack_frequency"] = survey_df["snack_frequency"].apply(lambda x: safe_dict(x, SNACK_FREQUENCIES, False))
 
-  survey_df["ar_frequency_int"] = survey_df["ar_frequency"].apply(lambda x: safe_dict(x, ar_frequencies_int, False))
-  survey_df["ar_frequency"] = survey_df["ar_frequency"].apply(lambda x: safe_dict(x, ar_frequencies, False))
+  survey_df["ar_frequency_int"] = survey_df["ar_frequency"].apply(lambda x: safe_dict(x, AR_FREQUENCIES_INT, False))
+  survey_df["ar_frequency"] = survey_df["ar_frequency"].apply(lambda x: safe_dict(x, AR_FREQUENCIES, False))
 
   survey_df["BI_avg"] = survey_df[["BI1", "BI2","BI3"]].mean(axis=1, numeric_only=True)
   survey_df["EE_avg"] = survey_df[["EE1", "EE2","EE3"]].mean(axis=1, numeric_only=True)
@@ -273,12 +397,120 @@ def combine_all_data():
   survey_df["PI_avg"] = survey_df[["PI1", "PI2","PI3"]].mean(axis=1, numeric_only=True)
   survey_df["SI_avg"] = survey_df[["SI1", "SI2","SI3"]].mean(axis=1, numeric_only=True)
   
-  survey_df.fillna(value=pd.np.nan, inplace=True)
+  survey_df.fillna(value=np.nan, inplace=True)
 
   return survey_df
 
+def new_trend_store():
+  return TrendStore(["{}_{}".format(col, task_nr) for task_nr in range(1,5) for col in TREND_COLS],
+                    TREND_BUCKET_SIZE)
+
+def new_study(basepath):
+  return {"basepath": basepath,
+          "lock": threading.Lock(),
+          "files": {},
+          "user_files": {},
+          "arrivals": {},
+          "pending": set(),
+          "trends": new_trend_store(),
+          "selections": SelectionIndex(),
+          "survey_df": None,
+          "issues": [],
+          "children": None,
+          "render": None,
+          "nbytes": 0,
+          "children_nbytes": 0}
+
+_studies = collections.OrderedDict((name, new_study(path)) for name, path in STUDIES.items())
+_studies_lock = threading.Lock()
+
+def study_name(pathname):
+  name = (pathname or "").strip("/").split("/")[0]
+  if name == "":
+    return next(iter(STUDIES))
+  return name
+
+def get_study(name):
+  #marks the study as most recently used
+  with _studies_lock:
+    study = _studies[name]
+    _studies.move_to_end(name)
+  return study
+
+def study_nbytes(study):
+  nbytes = study["survey_df"].memory_usage(deep=True).sum()
+  for cached in study["files"].values():
+    nbytes += cached["df"].memory_usage(deep=True).sum()
+  return int(nbytes)
+
+def children_nbytes(children):
+  #estimated by the size of the rendered sections as sent to the browser
+  from plotly.utils import PlotlyJSONEncoder
+  return len(json.dumps(children, cls=PlotlyJSONEncoder))
+
+def evict_idle_studies(active):
+  #drops the frames of the least recently used studies until all studies fit into STUDY_CACHE_BYTES
+  with _studies_lock:
+    total = sum(study["nbytes"] + study["children_nbytes"] for study in _studies.values())
+    for name, study in _studies.items():
+      if total <= STUDY_CACHE_BYTES:
+        break
+      if name == active or study["nbytes"] + study["children_nbytes"] == 0:
+        continue
+      #a study that is refreshing right now is not idle
+      if not study["lock"].acquire(False):
+        continue
+      print("evicting study {}".format(name))
+      total -= study["nbytes"] + study["children_nbytes"]
+      #everything is rebuilt from the files on the next visit, in the same order thanks to the arrivals
+      study["files"] = {}
+      study["user_files"] = {}
+      study["pending"] = set()
+      study["trends"] = new_trend_store()
+      study["selections"] = SelectionIndex()
+      study["survey_df"] = None
+      study["issues"] = []
+      study["children"] = None
+      study["nbytes"] = 0
+      study["children_nbytes"] = 0
+      study["lock"].release()
+
+def refresh_files(study):
+  #called with the study lock held, validates the files before anything is merged
+  #so the report is up to date even if a broken file makes the merge fail.
+  #the changed participants stay pending until the incremental updates went through,
+  #if the merge fails they are picked up again by the next refresh
+  changed = ingest_files(study)
+  if changed:
+    study["pending"].update(changed)
+    study["issues"] = [found for cached in study["files"].values() for found in cached["issues"]] + \
+                      validate_study(study["files"])
+
+def study_issues(name):
+  study = get_study(name)
+  with study["lock"]:
+    refresh_files(study)
+    return study["issues"]
+
+def study_survey_df(name):
+  #the returned frame is shared between requests, callers must not modify it in place
+  study = get_study(name)
+  with study["lock"]:
+    refresh_files(study)
+    if study["pending"] or study["survey_df"] is None:
+      study["survey_df"] = combine_all_data(study["files"])
+      study["children"] = None
+      study["children_nbytes"] = 0
+      study["nbytes"] = study_nbytes(study)
+      study["trends"].update(study["survey_df"], study["pending"], study["arrivals"])
+      study["selections"].update(study["pending"], study["files"], study["user_files"])
+      study["pending"] = set()
+    survey_df = study["survey_df"]
+  evict_idle_studies(name)
+  return survey_df
 
 def render_box_per_col(col, survey_df):
+  import plotly.graph_objs as go
   is_test = survey_df["group"] == "Test"
   is_control = survey_df["group"] == "Control"
   data = []
@@ -322,6 +554,7 @@ def render_box_per_col(col, survey_df):
   return graph_div
 
 def data_per_col(col, survey_df):
+  import plotly.graph_objs as go
   is_test = survey_df["group"] == "Test"
   is_control = survey_df["group"] == "Control"
 
@@ -344,6 +577,7 @@ def data_per_col(col, survey_df):
   return data
 
 def render_hist_per_col(col, survey_df):
+  import plotly.graph_objs as go
   data = data_per_col(col, survey_df)
 
   graph = dcc.Graph(
@@ -368,10 +602,11 @@ def render_hist_per_col(col, survey_df):
   return graph_div
 
 def render_table(survey_df):
+  import dash_table
   table =  dash_table.DataTable(
     id='table',
     columns=[{"name": i, "id": i} for i in survey_df.columns],
-    data=survey_df.to_dict("rows"),
+    data=survey_df.to_dict("records"),
   )
   return table  
 
@@ -379,16 +614,21 @@ def render_table(survey_df):
 #  filename = tracking_files[user_id][task_id]
 
 def calc_p_whitney(col, s, ns):
+  #returns u, p and the number of values in both groups
+  from scipy.stats import mannwhitneyu
   Rg = col.rank()
   
   nt = col[s].count()
   nc = col[ns].count()
 
-  if (Rg == Rg.iloc[0]).all():
+  if nt == 0 or nc == 0:
+    return np.nan, np.nan, nt, nc
+
+  if Rg.dropna().nunique() <= 1:
     return Rg[s].sum() - nt * (nt + 1) / 2, 0.5, nt, nc
 
-  u, p = stats.mannwhitneyu(Rg[s], Rg[ns])
-  return p
+  u, p = mannwhitneyu(Rg[s].dropna(), Rg[ns].dropna())
+  return u, p, nt, nc
 
 # def calc_p_whitney(colname, survey_df):
 #   col = survey_df[colname]
@@ -406,6 +646,7 @@ def calc_p_whitney(col, s, ns):
 #   return u, p, nt, nc
 
 def calc_p_t(colname, survey_df):
+  from scipy.stats import ttest_ind
   col = survey_df[colname]
   istest = survey_df["group"]=="Test"
   iscontrol = survey_df["group"]=="Control"
@@ -414,6 +655,7 @@ def calc_p_t(colname, survey_df):
   return t, p
 
 def table_group(task_nr, survey_df, header):
+  import dash_table
   istest = survey_df["group"] == "Test"
   iscontrol = survey_df["group"] == "Control"
 
@@ -438,29 +680,23 @@ def table_group(task_nr, survey_df, header):
   data = pd.DataFrame()
   for col in cols:
     col_name = "{}_{}".format(col, task_nr)
-    data.loc[col, "N Total"] = "[{}]".format(int(data.loc[col, "N Test"] + data.loc[col, "N Control"]))
+    n_test = int(len(survey_df[istest]))
+    n_control = int(len(survey_df[iscontrol]))
+    data.loc[col, "N Total"] = "[{}]".format(n_test + n_control)
     data.loc[col, "mean Total"] = "{:.2f}".format(survey_df[col_name].mean())
     data.loc[col, "SD Total"] = "({:.2f})".format(survey_df[col_name].std())
     
-    p = calc_p_whitney(survey_df["group"], istest, iscontrol)
+    u, p, _, _ = calc_p_whitney(survey_df[col_name], istest, iscontrol)
+    data.loc[col, "u group"] = "{:.1f}".format(u)
     data.loc[col, "p group"] = "{:.4f}".format(p)
-    data.loc[col, "N Test"] = "[{}]".format(int(len(survey_df[istest])))
+    data.loc[col, "N Test"] = "[{}]".format(n_test)
     data.loc[col, "mean Test"] = "{:.2f}".format(survey_df[col_name][istest].mean())
     data.loc[col, "SD Test"] = "({:.2f})".format(survey_df[col_name][istest].std())
-    data.loc[col, "N Control"] = "[{}]".format(int(len(survey_df[iscontrol])))
+    data.loc[col, "N Control"] = "[{}]".format(n_control)
     data.loc[col, "mean Control"] = "{:.2f}".format(survey_df[col_name][iscontrol].mean())
     data.loc[col, "SD Control"] = "({:.2f})".format(survey_df[col_name][iscontrol].std())
     
-    p = calc_p_whitney(survey_df["FL_avg"], isliterate, isilliterate)
-    data.loc[col, "p FL"] = "{:.4f}".format(p)
-    data.loc[col, "N FL>4.5"] = "[{}]".format(int(len(survey_df[isliterate])))
-    data.loc[col, "mean FL>4.5"] = "{:.2f}".format(survey_df[col_name][isliterate].mean())
-    data.loc[col, "SD FL>4.5"] = "({:.2f})".format(survey_df[col_name][isliterate].std())
-    data.loc[col, "N FL<=4.5"] = "[{}]".format(int(len(survey_df[isilliterate])))
-    data.loc[col, "mean FL<=4.5"] = "{:.2f}".format(survey_df[col_name][isilliterate].mean())
-    data.loc[col, "SD FL<=4.5"] = "({:.2f})".format(survey_df[col_name][isilliterate].std())
-
-    p = calc_p_whitney(survey_df["FL_avg"], isliterate, isilliterate)
+    _, p, _, _ = calc_p_whitney(survey_df[col_name], isliterate, isilliterate)
     data.loc[col, "p FL"] = "{:.4f}".format(p)
     data.loc[col, "N FL>4.5"] = "[{}]".format(int(len(survey_df[isliterate])))
     data.loc[col, "mean FL>4.5"] = "{:.2f}".format(survey_df[col_name][isliterate].mean())
@@ -471,22 +707,22 @@ def table_group(task_nr, survey_df, header):
 
 
   data["index"] = data.index
-  data_dict = data.to_dict("rows")
+  data_dict = data.to_dict("records")
 
   table =  dash_table.DataTable(
     id='table',
     columns=[ {"name": "", "id": "index"},
-              {"name": "u", "id": "u"},
-              {"name": "p", "id": "p"},
+              {"name": "u", "id": "u group"},
+              {"name": "p", "id": "p group"},
               {"name": "Total mean", "id": "mean Total"},
               {"name": "(SD)", "id": "SD Total"},
-              {"name": "[N]", "id": "Total N"},
+              {"name": "[N]", "id": "N Total"},
               {"name": "Test mean", "id": "mean Test"},
               {"name": "(SD)", "id": "SD Test"},
-              {"name": "[N]", "id": "Test N"},
+              {"name": "[N]", "id": "N Test"},
               {"name": "Control mean", "id": "mean Control"},
               {"name": "(SD)", "id": "SD Control"},
-              {"name": "[N]", "id": "Control N"}],
+              {"name": "[N]", "id": "N Control"}],
     data=data_dict,
     style_as_list_view=True,
     style_cell={'padding': '5px'},
@@ -498,7 +734,7 @@ def table_group(task_nr, survey_df, header):
         {
             'if': {'column_id': c},
             'textAlign': 'left'
-        } for c in ['index','SD Total', 'SD Test', 'SD Control', 'Total N', 'Test N', 'Control N']
+        } for c in ['index','SD Total', 'SD Test', 'SD Control', 'N Total', 'N Test', 'N Control']
     ],
   )
 
@@ -534,6 +770,7 @@ def creat_mean_desc(col, survey_df, header = None):
   return ret_div
 
 def create_count_desc(col, survey_df, header=None):
+  import dash_table
   data = pd.DataFrame()
   istest = survey_df["group"] == "Test"
   iscontrol = survey_df["group"] == "Control"
@@ -552,7 +789,7 @@ def create_count_desc(col, survey_df, header=None):
 
   data = data.sort_index()
 
-  data_dict = data.to_dict("rows")
+  data_dict = data.to_dict("records")
 
   table =  dash_table.DataTable(
     id='table',
@@ -601,8 +838,9 @@ def get_question_text_save(col, questions_df, question_ids):
     question_text = "Error: Question wasn't found"
   return question_text
 
-def create_survey(cols, survey_df, header):
-  questionsfile = os.path.join(BASEPATH, "questionlayout-evaluation.csv")
+def create_survey(cols, survey_df, header, basepath):
+  import dash_table
+  questionsfile = os.path.join(basepath, "questionlayout-evaluation.csv")
   questions_df = pd.read_csv(questionsfile, sep=";", index_col="question.id")
   questions_df["time_1"] = "task 1"
   questions_df["time_2"] = "task 2"
@@ -658,13 +896,13 @@ def create_survey(cols, survey_df, header):
   data["question"] = pd.Series(question_texts)
   
   for col in cols:
-    _, data.loc[col, "p (rank)"], _, _ = calc_p_whitney(col, survey_df_tmp)
+    _, data.loc[col, "p (rank)"], _, _ = calc_p_whitney(survey_df_tmp[col], istest, iscontrol)
     _, data.loc[col, "p (t)"] = calc_p_t(col, survey_df_tmp)
 
   data["p (rank)"] = data["p (rank)"].apply(lambda x : "{:.4f}".format(x))
   data["p (t)"] = data["p (t)"].apply(lambda x : "{:.4f}".format(x))
 
-  data_dict = data.to_dict("rows")
+  data_dict = data.to_dict("records")
 
   table =  dash_table.DataTable(
     id='table',
@@ -702,6 +940,118 @@ def create_survey(cols, survey_df, header):
   return ret_div
 
 
+def render_validation(issues):
+  import dash_table
+  if not issues:
+    return html.Div([html.H3("Validation"),
+                     html.P("No issues found")])
+
+  issues = sorted(issues, key=lambda found: (found["check"], found["file"]))
+  table =  dash_table.DataTable(
+    id='validation_table',
+    columns=[ {"name": "check", "id": "check"},
+              {"name": "file", "id": "file"},
+              {"name": "kind", "id": "kind"},
+              {"name": "N", "id": "count"},
+              {"name": "", "id": "detail"}],
+    data=issues,
+    style_as_list_view=True,
+    style_cell={'padding': '5px', 'textAlign': 'left'},
+    style_header={
+        'backgroundColor': 'white',
+        'fontWeight': 'bold'
+    },
+  )
+
+  ret_div = html.Div([html.H3("Validation"),
+                      html.P("{} issues in {} files".format(len(issues), len(set(found["file"] for found in issues if found["file"])))),
+                      html.Div( [table],
+                                style={ 'padding-top': '10',
+                                        'padding-bottom': '30',
+                                        'padding-left': '30',
+                                        'padding-right': '5'})])
+
+  return ret_div
+
+def render_trend(trends, mode, task_nr):
+  import plotly.graph_objs as go
+  graphs = []
+  for col, rows in trends.items():
+    data = []
+    for group, color in [("Test", 'rgb(7,40,89)'), ("Control", 'rgb(107,174,214)')]:
+      x = [row["bucket"] for row in rows[group]]
+      data.append(go.Scatter(
+        x = x,
+        y = [row["mean"] for row in rows[group]],
+        text = ["N = {}".format(row["N"]) for row in rows[group]],
+        name = "{} mean".format(group.lower()),
+        mode = "lines+markers",
+        line = dict(
+            color = color)
+      ))
+      data.append(go.Scatter(
+        x = x,
+        y = [row["median"] for row in rows[group]],
+        name = "{} median".format(group.lower()),
+        mode = "lines",
+        line = dict(
+            color = color,
+            dash = "dot")
+      ))
+
+    graph = dcc.Graph(
+      figure = go.Figure(
+        data = data,
+        layout = go.Layout(
+          title = "{} (task {})".format(col, task_nr),
+          xaxis = dict(title = "day" if mode == "day" else "participants", type = "category"),
+          showlegend=True,
+          legend=go.layout.Legend(
+              x=0,
+              y=1.0
+          ),
+          margin=go.layout.Margin(l=40, r=0, t=40, b=30)
+        )
+      ),
+      style={'height': 300}
+    )
+
+    graphs.append(html.Div([graph],
+        style={'padding-top': '20',
+              'padding-bottom': '20'}))
+
+  return graphs
+
+
+def render_selections(heatmaps, task_nr):
+  import plotly.graph_objs as go
+  graphs = []
+  for group, (box_nrs, product_ids, z) in heatmaps.items():
+    graph = dcc.Graph(
+      figure = go.Figure(
+        data = [go.Heatmap(
+          x = box_nrs,
+          y = [str(product_id) for product_id in product_ids],
+          z = z,
+          colorscale = "Blues",
+        )],
+        layout = go.Layout(
+          title = "{} (task {})".format(group, task_nr),
+          xaxis = dict(title = "BoxNr", type = "category"),
+          yaxis = dict(title = "ProductId", type = "category"),
+          margin=go.layout.Margin(l=80, r=0, t=40, b=40)
+        )
+      ),
+      style={'height': 500}
+    )
+
+    graphs.append(html.Div([graph],
+        style={'padding-top': '20',
+              'padding-bottom': '20'}))
+
+  return graphs
+
+
 def bmi_class(bmi):
   if bmi < 18.5:
     return "0:) Underweight (BMI < 18.5)"
@@ -724,7 +1074,14 @@ def safe_dict(_key, _dict, _int=True):
   
 
 app.layout = html.Div([
+    dcc.Location(id="url"),
     html.Button("Refresh", id="refresh"),
+    html.Div([],
+      id="validation",
+      style={'width':'70%',
+            'padding-top': '40',
+            'padding-left': '50',
+            'padding-right': '50'}),
     html.Div([], 
       id="graphs", 
       style={'width':'70%',
@@ -732,15 +1089,46 @@ app.layout = html.Div([
             'padding-bottom': '10',
             'padding-left': '50',
             'padding-right': '50'}),
+    html.Div([
+        html.Hr(),
+        html.H1("Trend"),
+        html.H2("Cumulative results as participants accumulate"),
+        dcc.RadioItems(
+          id="trend-bucket",
+          options=[{"label": "per day", "value": "day"},
+                   {"label": "per {} participants".format(TREND_BUCKET_SIZE), "value": "participants"}],
+          value="day"),
+        dcc.Dropdown(
+          id="trend-task",
+          options=[{"label": "Task {}".format(task_nr), "value": task_nr} for task_nr in range(1,5)],
+          value=1,
+          clearable=False),
+        html.Div([], id="trend-graphs"),
+      ],
+      style={'width':'70%',
+            'padding-bottom': '10',
+            'padding-left': '50',
+            'padding-right': '50'}),
+    html.Div([
+        html.Hr(),
+        html.H1("Selections"),
+        html.H2("Chosen products per box of the machine layout"),
+        dcc.Dropdown(
+          id="selection-task",
+          options=[{"label": "Task {}".format(task_nr), "value": task_nr} for task_nr in range(1,5)],
+          value=1,
+          clearable=False),
+        html.Div([], id="selection-graphs"),
+      ],
+      style={'width':'70%',
+            'padding-bottom': '10',
+            'padding-left': '50',
+            'padding-right': '50'}),
 ])
 
 
 
-@app.callback(Output("graphs", "children"),
-              [Input("refresh", "n_clicks")])
-def update_survey(_):
-  survey_df = combine_all_data()
-
+def render_survey(survey_df, basepath):
   print("printing new data")
   return [creat_mean_desc("age", survey_df, "Age"),
           create_count_desc("age_class", survey_df, "Age"),
@@ -753,7 +1141,8 @@ def update_survey(_):
           create_count_desc("ar_frequency", survey_df, "AR Usage Frequency"),
           create_survey(["ar_frequency_int"],
                         survey_df,
-                        "AR Frequency"),
+                        "AR Frequency",
+                        basepath),
           html.Hr(),
           table_group(1, survey_df, "Choose a snack of your choice"),
           html.Hr(),
@@ -765,41 +1154,301 @@ def update_survey(_):
           html.Hr(),
           create_survey(["time_1", "time_2","time_3","time_4"],
                         survey_df,
-                        "Time Taken per Task"),
+                        "Time Taken per Task",
+                        basepath),
           html.Hr(),              
           create_survey(["IE1", "IE2"],
                         survey_df,
-                        "Intervention Effect"),
+                        "Intervention Effect",
+                        basepath),
           create_survey(["PE1", "PE2", "PE3"],
                         survey_df,
-                        "Performance Expectancy"),
+                        "Performance Expectancy",
+                        basepath),
           create_survey(["EE1", "EE2", "EE3"],
                         survey_df,
-                        "Effort Expectancy"),
+                        "Effort Expectancy",
+                        basepath),
           create_survey(["SI2", "SI3"],
                         survey_df,
-                        "Social Influence"),
+                        "Social Influence",
+                        basepath),
           create_survey(["HM1", "HM2"],
                         survey_df,
-                        "Hedonic Motivations"),
+                        "Hedonic Motivations",
+                        basepath),
           create_survey(["PI1", "PI2", "PI3"],
                         survey_df,
-                        "Personal Innovativeness"),
+                        "Personal Innovativeness",
+                        basepath),
           create_survey(["BI1", "BI2", "BI3"],
                         survey_df,
-                        "Behavioural Intention"),
+                        "Behavioural Intention",
+                        basepath),
           create_survey(["FL2", "FL3"],
                         survey_df,
-                        "Food Literacy (ohne FL1)"),
+                        "Food Literacy (ohne FL1)",
+                        basepath),
           create_survey(["FL1", "FL2", "FL3"],
                         survey_df,
-                        "Food Literacy"),
+                        "Food Literacy",
+                        basepath),
           create_survey(["SI1"],
                         survey_df,
-                        "Observation Bias"),
+                        "Observation Bias",
+                        basepath),
           #render_table(survey_df)
         ]
 
+def study_children(name):
+  survey_df = study_survey_df(name)
+  study = get_study(name)
+  with study["lock"]:
+    children = study["children"]
+    if children is not None:
+      return children
+    #one request renders, concurrent viewers wait for it and get its result
+    #instead of all rendering the same survey
+    render = study["render"]
+    waiting = render is not None
+    if not waiting:
+      render = study["render"] = {"done": threading.Event(), "children": None, "error": None}
+
+  if waiting:
+    render["done"].wait()
+    if render["error"] is not None:
+      raise render["error"]
+    return render["children"]
+
+  try:
+    #create_count_desc fills in missing values, keep the cached frame untouched
+    children = render_survey(survey_df.copy(), study["basepath"])
+    nbytes = children_nbytes(children)
+    render["children"] = children
+  except Exception as e:
+    render["error"] = e
+    raise
+  finally:
+    with study["lock"]:
+      study["render"] = None
+      #only keep the rendering if no newer data arrived in the meantime
+      if render["children"] is not None and study["survey_df"] is survey_df:
+        study["children"] = children
+        study["children_nbytes"] = nbytes
+    render["done"].set()
+  evict_idle_studies(name)
+  return children
+
+@app.callback(Output("graphs", "children"),
+              [Input("refresh", "n_clicks"),
+               Input("url", "pathname")])
+def update_survey(_, pathname):
+  name = study_name(pathname)
+  if name not in STUDIES:
+    return [html.H3("Unknown study {}".format(name))]
+  return study_children(name)
+
+@app.callback(Output("validation", "children"),
+              [Input("refresh", "n_clicks"),
+               Input("url", "pathname")])
+def update_validation(_, pathname):
+  #separate from the graphs and independent of the merge, so the issues are shown
+  #even if merging or rendering the survey fails
+  name = study_name(pathname)
+  if name not in STUDIES:
+    return []
+  return [render_validation(study_issues(name)), html.Hr()]
+
+
+@app.callback(Output("trend-graphs", "children"),
+              [Input("refresh", "n_clicks"),
+               Input("url", "pathname"),
+               Input("trend-bucket", "value"),
+               Input("trend-task", "value")])
+def update_trend(_, pathname, mode, task_nr):
+  name = study_name(pathname)
+  if name not in STUDIES:
+    return []
+
+  study_survey_df(name)
+  study = get_study(name)
+  with study["lock"]:
+    trends = {col: {group: study["trends"].cumulative(mode, group, "{}_{}".format(col, task_nr))
+                    for group in ["Test", "Control"]}
+              for col in TREND_COLS}
+  return render_trend(trends, mode, task_nr)
+
+@app.callback(Output("selection-graphs", "children"),
+              [Input("refresh", "n_clicks"),
+               Input("url", "pathname"),
+               Input("selection-task", "value")])
+def update_selections(_, pathname, task_nr):
+  name = study_name(pathname)
+  if name not in STUDIES:
+    return []
+
+  study_survey_df(name)
+  study = get_study(name)
+  with study["lock"]:
+    heatmaps = collections.OrderedDict((group, study["selections"].heatmap(group, task_nr))
+                                       for group in ["Test", "Control"])
+  return render_selections(heatmaps, task_nr)
+
+
+def export_columns(survey_df, task_nr=None):
+  if task_nr is None:
+    return list(survey_df.columns)
+  cols = ["group", "t_{}".format(task_nr)] + ["{}_{}".format(col, task_nr) for col in TASK_COLS]
+  return [col for col in cols if col in survey_df.columns]
+
+def export_chunks(survey_df, group=None, task_nr=None):
+  #slices the frame chunk by chunk so a filtered export never copies the whole frame
+  cols = export_columns(survey_df, task_nr)
+  for start in range(0, len(survey_df), EXPORT_CHUNK_ROWS):
+    chunk = survey_df.iloc[start:start + EXPORT_CHUNK_ROWS]
+    if group is not None:
+      chunk = chunk[chunk["group"] == group]
+    yield chunk[cols]
+
+def stream_csv(survey_df, group=None, task_nr=None):
+  header = True
+  for chunk in export_chunks(survey_df, group, task_nr):
+    yield chunk.to_csv(header=header, index_label="user_id")
+    header = False
+  if header:
+    #nothing matched the filter, still send the header line
+    yield survey_df.iloc[:0][export_columns(survey_df, task_nr)].to_csv(index_label="user_id")
+
+class ParquetSink(object):
+  #write-only file object that hands out the bytes written so far,
+  #tell() keeps counting so the offsets in the parquet footer stay valid
+  def __init__(self):
+    self.pending = []
+    self.position = 0
+    self.closed = False
+
+  def write(self, data):
+    self.pending.append(bytes(data))
+    self.position += len(data)
+    return len(data)
+
+  def tell(self):
+    return self.position
+
+  def flush(self):
+    pass
+
+  def close(self):
+    self.closed = True
+
+  def drain(self):
+    data = b"".join(self.pending)
+    self.pending = []
+    return data
+
+def parquet_schema(survey_df, task_nr=None):
+  #taken from the dtypes alone so it is known before the response starts,
+  #object columns can mix strings and numbers (a broken answer next to valid
+  #ones) or be entirely empty, they are exported as strings
+  import pyarrow as pa
+  schema = pa.Schema.from_pandas(survey_df[export_columns(survey_df, task_nr)].iloc[:0], preserve_index=True)
+  return pa.schema([pa.field(field.name, pa.string()) if pa.types.is_null(field.type) else field
+                    for field in schema],
+                   metadata=schema.metadata)
+
+def parquet_chunk(chunk):
+  #missing values stay empty, everything else in an object column becomes a string
+  chunk = chunk.assign(**{col: chunk[col].where(chunk[col].isna(), chunk[col].astype(str))
+                          for col in chunk.columns if chunk[col].dtype == object})
+  if chunk.index.dtype == object:
+    chunk.index = chunk.index.astype(str)
+  return chunk
+
+def stream_parquet(survey_df, schema, group=None, task_nr=None):
+  import pyarrow as pa
+  import pyarrow.parquet as pq
+
+  sink = ParquetSink()
+  writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema)
+  for chunk in export_chunks(survey_df, group, task_nr):
+    if len(chunk):
+      writer.write_table(pa.Table.from_pandas(parquet_chunk(chunk), schema=schema, preserve_index=True))
+      yield sink.drain()
+  writer.close()
+  yield sink.drain()
+
+@app.server.route("/export.<fmt>")
+@app.server.route("/<study>/export.<fmt>")
+def export_survey(fmt, study=None):
+  name = study_name(study)
+  if name not in STUDIES:
+    abort(404)
+  group = request.args.get("group")
+  task_nr = request.args.get("task")
+  if task_nr is not None:
+    if task_nr not in ("1", "2", "3", "4"):
+      abort(400)
+    task_nr = int(task_nr)
+
+  survey_df = study_survey_df(name)
+
+  if fmt == "csv":
+    chunks = stream_csv(survey_df, group, task_nr)
+    mimetype = "text/csv"
+  elif fmt == "parquet":
+    try:
+      import pyarrow
+    except ImportError:
+      abort(501)
+    chunks = stream_parquet(survey_df, parquet_schema(survey_df, task_nr), group, task_nr)
+    mimetype = "application/octet-stream"
+  else:
+    abort(404)
+
+  #the first chunk is written before the headers are sent, so a file that
+  #cannot be exported ends in an error instead of a truncated download
+  first = next(chunks)
+  return Response(itertools.chain([first], chunks),
+                  mimetype=mimetype,
+                  headers={"Content-Disposition": "attachment; filename={}.{}".format(name, fmt)})
+
+
+#"warming" until warm_studies is done, then "warm" or "failed" if a study could not be loaded
+_warm_state = {"state": "warming" if WARM_START else "ready", "failed": []}
+
+def warm_studies():
+  import plotly.graph_objs
+  import dash_table
+  import scipy.stats
+  for name in STUDIES:
+    try:
+      study_children(name)
+    except Exception as e:
+      print("warming study {} failed: {!r}".format(name, e), file=sys.stderr)
+      _warm_state["failed"].append(name)
+  _warm_state["state"] = "failed" if _warm_state["failed"] else "warm"
+  print("studies {}".format(_warm_state["state"]))
+
+@app.server.route("/healthz")
+def healthz():
+  #ready as soon as the layout can be served, the data may still be loading,
+  #"ready" means the data is only loaded by the first request (WARM_START=0)
+  if _warm_state["state"] == "failed":
+    return Response("failed", status=503, mimetype="text/plain")
+  return Response(_warm_state["state"], mimetype="text/plain")
+
+def serving_process():
+  #with the debug reloader the started process only watches the files and
+  #serves from a child process, which is marked with WERKZEUG_RUN_MAIN
+  if __name__ == '__main__' and DEBUG:
+    return os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+  return True
+
+if WARM_START and serving_process():
+  threading.Thread(target=warm_studies, name="warm-studies", daemon=True).start()
+
 
 if __name__ == '__main__':
-  app.run_server(debug=True, host="0.0.0.0", port=80)
\ No newline at end of file
+  app.run_server(debug=DEBUG,
+                 host="0.0.0.0",
+                 port=int(os.environ.get("PORT", 80)))
\ No newline at end of file
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+#simulates concurrent dashboard viewers: writes a synthetic study, starts the
+#dashboard on it and lets N clients press refresh as fast as the server answers
+#
+#  python loadtest.py --participants 200 --clients 8 --duration 30
+#
+#reports latency percentiles, throughput, payload sizes and the memory of the
+#server over time, --json writes the same numbers for comparing runs
+#
+#the clients start once the server reports the study as warm, the first
+#refresh after that is timed on its own and not part of the percentiles.
+#a refresh in the browser fires three callbacks (graphs, trend-graphs and
+#selection-graphs), the clients only drive the one for graphs
+#
+#exits with 1 if any request failed or none succeeded
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+import urllib.request
+import urllib.error
+from nutris import nutris
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STUDY = "loadtest"
+
+AGES = [0, 1, 2, 3, 4, 5]
+WEIGHTS = ["50-59", "60-69", "70-79", "80-89", "90-99"]
+HEIGHTS = ["150-159", "160-169", "170-179", "180-189"]
+GENDERS = ["male", "female"]
+DIETS = ["No I don't follow a certain diet", "I eat vegetarian", "I follow a diet low in carbohydrates"]
+EDUCATIONS = ["High school", "Vocational school", "College / University"]
+SNACK_FREQUENCIES = ["never", "monthly", "weekly", "daily"]
+AR_FREQUENCIES = ["Never used", "Tried once or twice", "I use it sometimes"]
+LIKERT_ITEMS = ["IE1", "IE2", "PE1", "PE2", "PE3", "EE1", "EE2", "EE3", "SI1", "SI2", "SI3",
+                "HM1", "HM2", "PI1", "PI2", "PI3", "BI1", "BI2", "BI3", "FL1", "FL2", "FL3"]
+BOXES = 20
+
+
+def write_csv(path, header, rows, sep=";"):
+  with open(path, "w") as f:
+    f.write(sep.join(header) + "\n")
+    for row in rows:
+      f.write(sep.join(str(value) for value in row) + "\n")
+
+def write_participant(basepath, user_id, rng):
+  product_ids = sorted(nutris)
+  layout = [(box_nr, rng.choice(product_ids), rng.choice("ABCDE"), rng.randint(-10, 30)) for box_nr in range(1, BOXES + 1)]
+  for task_nr in range(1, 5):
+    write_csv(os.path.join(basepath, "{}_{}_machineLayout.csv".format(user_id, task_nr)),
+              ["BoxNr", "ProductId", "ProductNutriLabel", "ProductNutriScore"],
+              layout)
+    timestamps = sorted(rng.randint(1000, 120000) for _ in range(20))
+    write_csv(os.path.join(basepath, "{}_{}_trackings_log.csv".format(user_id, task_nr)),
+              ["timestamp", "x", "y"],
+              [(timestamp, rng.random(), rng.random()) for timestamp in timestamps],
+              sep=",")
+
+  write_csv(os.path.join(basepath, "{}_basic_survey.csv".format(user_id)),
+            ["user_id", "group", "age", "weight", "height", "gender", "diet", "education", "snack_frequency", "ar_frequency"],
+            [(user_id, rng.choice(["Test", "Control"]), rng.choice(AGES), rng.choice(WEIGHTS), rng.choice(HEIGHTS),
+              rng.choice(GENDERS), rng.choice(DIETS), rng.choice(EDUCATIONS), rng.choice(SNACK_FREQUENCIES),
+              rng.choice(AR_FREQUENCIES))])
+  write_csv(os.path.join(basepath, "{}_task_survey.csv".format(user_id)),
+            ["user_id", "t_1", "t_2", "t_3", "t_4"],
+            [[user_id] + [rng.randint(1, BOXES) for _ in range(4)]])
+  write_csv(os.path.join(basepath, "{}_evaluation_survey.csv".format(user_id)),
+            ["user_id"] + LIKERT_ITEMS,
+            [[user_id] + [rng.randint(1, 7) for _ in LIKERT_ITEMS]])
+  write_csv(os.path.join(basepath, "{}_guess_survey.csv".format(user_id)),
+            ["user_id", "guess"],
+            [(user_id, rng.choice(["Test", "Control"]))])
+
+def write_study(basepath, participants, rng):
+  write_csv(os.path.join(basepath, "questionlayout-evaluation.csv"), ["question.id", " question.text,"], [])
+  for user_id in range(participants):
+    write_participant(basepath, 100000 + user_id, rng)
+
+def get(url):
+  try:
+    with urllib.request.urlopen(url, timeout=1) as response:
+      return response.status, response.read()
+  except urllib.error.HTTPError as e:
+    return e.code, e.read()
+  except (urllib.error.URLError, ConnectionError, OSError):
+    return None, b""
+
+def refresh_payload(n_clicks):
+  return json.dumps({
+    "output": "graphs.children",
+    "outputs": {"id": "graphs", "property": "children"},
+    "inputs": [{"id": "refresh", "property": "n_clicks", "value": n_clicks},
+               {"id": "url", "property": "pathname", "value": "/" + STUDY}],
+    "changedPropIds": ["refresh.n_clicks"],
+    "state": [],
+  }).encode("utf-8")
+
+def rss_mb(pid):
+  #resident memory of the server, only available on linux
+  try:
+    with open("/proc/{}/status".format(pid)) as f:
+      for line in f:
+        if line.startswith("VmRSS:"):
+          return int(line.split()[1]) / 1024
+  except OSError:
+    pass
+  return None
+
+def refresh(url, n_clicks):
+  request = urllib.request.Request(url, data=refresh_payload(n_clicks), headers={"Content-Type": "application/json"})
+  start = time.time()
+  try:
+    with urllib.request.urlopen(request, timeout=120) as response:
+      status = response.status
+      size = len(response.read())
+  except urllib.error.HTTPError as e:
+    status = e.code
+    size = len(e.read())
+  except (urllib.error.URLError, ConnectionError, OSError):
+    status = None
+    size = 0
+  return {"start": start, "latency": time.time() - start, "status": status, "bytes": size}
+
+def client(url, deadline, results, lock):
+  n_clicks = 0
+  while time.time() < deadline:
+    n_clicks += 1
+    result = refresh(url, n_clicks)
+    with lock:
+      results.append(result)
+
+def percentile(values, q):
+  values = sorted(values)
+  if not values:
+    return float("nan")
+  return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--participants", type=int, default=100)
+  parser.add_argument("--clients", type=int, default=4)
+  parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+  parser.add_argument("--arrival-interval", type=float, default=0,
+                      help="write a new participant every that many seconds during the test, 0 for none")
+  parser.add_argument("--port", type=int, default=8050)
+  parser.add_argument("--data", default=None, help="directory for the synthetic study, defaults to a temporary one")
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--json", default=None, help="write the results to this file")
+  parser.add_argument("--log", default=None, help="file for the output of the server, defaults to a temporary one")
+  args = parser.parse_args()
+
+  rng = random.Random(args.seed)
+  basepath = args.data or tempfile.mkdtemp(prefix="holoselecta-loadtest-")
+  if not os.path.isdir(basepath):
+    os.makedirs(basepath)
+  write_study(basepath, args.participants, rng)
+  print("synthetic study with {} participants in {}".format(args.participants, basepath))
+
+  #the server logs every request, keep that out of the report
+  log_path = args.log or os.path.join(basepath, "server.log")
+  log = open(log_path, "w")
+  print("server log in {}".format(log_path))
+
+  env = dict(os.environ, PORT=str(args.port), DEBUG="0", STUDIES="{}={}".format(STUDY, basepath))
+  server = subprocess.Popen([sys.executable, os.path.join(HERE, "dashboard.py")],
+                            cwd=HERE,
+                            env=env,
+                            stdout=log,
+                            stderr=subprocess.STDOUT)
+  base = "http://127.0.0.1:{}".format(args.port)
+  url = base + "/_dash-update-component"
+  try:
+    #"warm" once the background warm-up is done, "ready" if it is switched off
+    launched = time.time()
+    while True:
+      status, body = get(base + "/healthz")
+      if body in [b"warm", b"ready"]:
+        break
+      if body == b"failed":
+        sys.exit("warming the study failed, see {}".format(log_path))
+      if server.poll() is not None:
+        sys.exit("dashboard exited with code {}, see {}".format(server.returncode, log_path))
+      time.sleep(0.1)
+    warm_time = time.time() - launched
+    first = refresh(url, 0)
+    print("server {} after {:.2f}s, first refresh {} in {:.3f}s".format(
+      body.decode(), warm_time, first["status"], first["latency"]))
+
+    results = []
+    lock = threading.Lock()
+    memory = []
+    start = time.time()
+    deadline = start + args.duration
+    clients = [threading.Thread(target=client, args=(url, deadline, results, lock))
+               for _ in range(args.clients)]
+    for thread in clients:
+      thread.start()
+
+    next_user_id = 100000 + args.participants
+    next_arrival = start + args.arrival_interval
+    while any(thread.is_alive() for thread in clients):
+      now = time.time()
+      memory.append((now - start, rss_mb(server.pid)))
+      if args.arrival_interval > 0 and now >= next_arrival and now < deadline:
+        write_participant(basepath, next_user_id, rng)
+        next_user_id += 1
+        next_arrival += args.arrival_interval
+      time.sleep(0.5)
+    elapsed = time.time() - start
+  finally:
+    server.terminate()
+    server.wait()
+    log.close()
+
+  ok = [result for result in results if result["status"] == 200]
+  statuses = {}
+  for result in results:
+    statuses[str(result["status"])] = statuses.get(str(result["status"]), 0) + 1
+  latencies = [result["latency"] for result in ok]
+  sizes = [result["bytes"] for result in ok]
+  rss = [mb for _, mb in memory if mb is not None]
+  report = {
+    "participants": args.participants,
+    "clients": args.clients,
+    "duration": elapsed,
+    "warm_time": warm_time,
+    "first_request": first,
+    "requests": len(results),
+    "errors": len(results) - len(ok),
+    "statuses": statuses,
+    "throughput": len(ok) / elapsed,
+    "latency": {"p50": percentile(latencies, 0.5),
+                "p90": percentile(latencies, 0.9),
+                "p99": percentile(latencies, 0.99),
+                "max": max(latencies) if latencies else float("nan"),
+                "mean": statistics.mean(latencies) if latencies else float("nan")},
+    "bytes": {"mean": statistics.mean(sizes) if sizes else float("nan"),
+              "max": max(sizes) if sizes else 0},
+    "rss_mb": {"start": rss[0] if rss else None,
+               "peak": max(rss) if rss else None,
+               "end": rss[-1] if rss else None},
+    "memory": memory,
+  }
+
+  print("requests    {} ({} errors) in {:.1f}s, {:.2f} req/s".format(
+    report["requests"], report["errors"], elapsed, report["throughput"]))
+  print("status      " + "  ".join("{}: {}".format(status, count) for status, count in sorted(statuses.items())))
+  if not ok:
+    if args.json:
+      with open(args.json, "w") as f:
+        json.dump(report, f, indent=2)
+    sys.exit("no successful requests")
+  print("latency     p50 {p50:.3f}s  p90 {p90:.3f}s  p99 {p99:.3f}s  max {max:.3f}s".format(**report["latency"]))
+  print("payload     mean {:.0f} bytes  max {} bytes".format(report["bytes"]["mean"], report["bytes"]["max"]))
+  if rss:
+    print("server rss  start {:.0f}MB  peak {:.0f}MB  end {:.0f}MB".format(rss[0], max(rss), rss[-1]))
+    step = max(1, len(memory) // 10)
+    print("rss over time  " + "  ".join("{:.0f}s:{:.0f}MB".format(t, mb) for t, mb in memory[::step] if mb is not None))
+
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump(report, f, indent=2)
+
+  if report["errors"]:
+    sys.exit("{} of {} requests failed".format(report["errors"], report["requests"]))
+
+if __name__ == '__main__':
+  main()
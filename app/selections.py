@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+import collections
+import pandas as pd
+
+TASK_NRS = [1, 2, 3, 4]
+
+
+def _box_nr(value):
+  try:
+    return int(value)
+  except (TypeError, ValueError):
+    return None
+
+
+class SelectionIndex(object):
+  #inverted index over the product choices of all participants
+  #  products  ProductId -> {(user_id, task)}
+  #  boxes     BoxNr -> {(user_id, task)}
+  #  counts    (group, task) -> {(BoxNr, ProductId): number of selections}
+  #participants are replaced one by one when their files change, the
+  #machine layouts are never scanned as a whole
+  def __init__(self):
+    self.products = collections.defaultdict(set)
+    self.boxes = collections.defaultdict(set)
+    self.counts = collections.defaultdict(collections.Counter)
+    self.selections = {}
+
+  def remove(self, user_id):
+    for group, task_nr, box_nr, product_id in self.selections.pop(user_id, []):
+      self.products[product_id].discard((user_id, task_nr))
+      self.boxes[box_nr].discard((user_id, task_nr))
+      self.counts[(group, task_nr)][(box_nr, product_id)] -= 1
+      if not self.products[product_id]:
+        del self.products[product_id]
+      if not self.boxes[box_nr]:
+        del self.boxes[box_nr]
+
+  def add(self, user_id, group, task_nr, box_nr, product_id):
+    self.selections.setdefault(user_id, []).append((group, task_nr, box_nr, product_id))
+    self.products[product_id].add((user_id, task_nr))
+    self.boxes[box_nr].add((user_id, task_nr))
+    self.counts[(group, task_nr)][(box_nr, product_id)] += 1
+
+  def update(self, user_ids, files, user_files):
+    #user_ids are the participants with new, changed or deleted files,
+    #user_files maps each participant to the names of their files
+    for user_id in user_ids:
+      self.remove(user_id)
+      #same order as combine_all_data, so the index agrees with the merged frame
+      own = [files[filename] for filename in sorted(user_files.get(user_id, []))]
+      layouts = [cached["df"] for cached in own if cached["kind"] == "machineLayout"]
+      tasks = [cached["df"] for cached in own if cached["kind"] == "task" and len(cached["df"])]
+      if not layouts or not tasks:
+        continue
+
+      #like combine_first the last file with a group wins
+      group = None
+      for cached in own:
+        if cached["kind"] != "machineLayout" and "group" in cached["df"].columns:
+          groups = cached["df"]["group"].dropna()
+          if len(groups):
+            group = groups.iloc[0]
+      if group is None:
+        continue
+
+      #the machine layout is the same for all tasks, like in combine_all_data
+      #the first box with that number in sorted file order wins
+      layout = pd.concat(layouts).reindex(columns=["BoxNr", "ProductId"])
+      layout = layout.assign(BoxNr=pd.to_numeric(layout["BoxNr"], errors="coerce")).dropna()
+      products = layout.drop_duplicates(subset="BoxNr").set_index("BoxNr")["ProductId"]
+
+      #the last task file wins like with combine_first
+      answers = tasks[-1]
+      for task_nr in TASK_NRS:
+        col = "t_{}".format(task_nr)
+        if not col in answers.columns:
+          continue
+        box_nr = _box_nr(answers[col].iloc[0])
+        if box_nr is not None and box_nr in products.index:
+          self.add(user_id, group, task_nr, box_nr, products[box_nr])
+
+  def heatmap(self, group, task_nr):
+    #selection counts as BoxNr x ProductId matrix, the axes cover every box
+    #and product ever selected so the maps of both groups line up
+    box_nrs = sorted(self.boxes)
+    product_ids = sorted(self.products, key=str)
+    counts = self.counts.get((group, task_nr), {})
+    z = [[counts.get((box_nr, product_id), 0) for box_nr in box_nrs] for product_id in product_ids]
+    return box_nrs, product_ids, z
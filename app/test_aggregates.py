@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+#python -m unittest test_aggregates (from the app directory)
+import random
+import unittest
+import pandas as pd
+from aggregates import Moments, RankSketch, TrendStore
+
+RELATIVE_ACCURACY = 0.01
+
+
+class MomentsTest(unittest.TestCase):
+  def test_matches_pandas_after_remove_and_add(self):
+    rng = random.Random(0)
+    values = [rng.uniform(-20, 30) for _ in range(200)]
+    moments = Moments()
+    for value in values:
+      moments.add(value)
+    #replace a third of the values, like participants whose files changed
+    for i in range(0, len(values), 3):
+      moments.remove(values[i])
+      values[i] = rng.uniform(-20, 30)
+      moments.add(values[i])
+
+    self.assertEqual(moments.count, len(values))
+    self.assertAlmostEqual(moments.mean(), pd.Series(values).mean(), places=9)
+    self.assertAlmostEqual(moments.std(), pd.Series(values).std(), places=9)
+
+  def test_merge(self):
+    first, second = Moments(), Moments()
+    for value in [1, 2, 3]:
+      first.add(value)
+    for value in [10, 20]:
+      second.add(value)
+    first.merge(second)
+    self.assertAlmostEqual(first.mean(), pd.Series([1, 2, 3, 10, 20]).mean())
+    self.assertAlmostEqual(first.std(), pd.Series([1, 2, 3, 10, 20]).std())
+
+  def test_too_few_values(self):
+    moments = Moments()
+    self.assertTrue(pd.isna(moments.mean()))
+    moments.add(4)
+    self.assertEqual(moments.mean(), 4)
+    self.assertTrue(pd.isna(moments.std()))
+
+
+class RankSketchTest(unittest.TestCase):
+  def assertClose(self, value, expected):
+    self.assertLessEqual(abs(value - expected), RELATIVE_ACCURACY * abs(expected) + 1e-9,
+                         "{} is not within {:.0%} of {}".format(value, RELATIVE_ACCURACY, expected))
+
+  def test_median_of_even_count_is_interpolated(self):
+    #integer scores, the two middle values differ
+    for values in [[9, 10], [3, 7, 19, 25], [-5, -2, 0, 4]]:
+      sketch = RankSketch(RELATIVE_ACCURACY)
+      for value in values:
+        sketch.add(value)
+      self.assertClose(sketch.quantile(0.5), pd.Series(values).median())
+
+  def test_quantiles_match_pandas_after_remove_and_add(self):
+    rng = random.Random(1)
+    values = [rng.randint(-10, 30) for _ in range(101)]
+    sketch = RankSketch(RELATIVE_ACCURACY)
+    for value in values:
+      sketch.add(value)
+    for i in range(0, len(values), 4):
+      sketch.remove(values[i])
+      values[i] = rng.randint(-10, 30)
+      sketch.add(values[i])
+    #and one participant less for an even count
+    sketch.remove(values.pop())
+
+    for q in [0, 0.1, 0.25, 0.5, 0.75, 0.9, 1]:
+      self.assertClose(sketch.quantile(q), pd.Series(values).quantile(q))
+
+  def test_merge(self):
+    rng = random.Random(2)
+    first_values = [rng.uniform(0.5, 40) for _ in range(50)]
+    second_values = [rng.uniform(0.5, 40) for _ in range(31)]
+    first, second = RankSketch(RELATIVE_ACCURACY), RankSketch(RELATIVE_ACCURACY)
+    for value in first_values:
+      first.add(value)
+    for value in second_values:
+      second.add(value)
+    first.merge(second)
+    self.assertClose(first.quantile(0.5), pd.Series(first_values + second_values).median())
+
+  def test_empty(self):
+    sketch = RankSketch(RELATIVE_ACCURACY)
+    self.assertTrue(pd.isna(sketch.quantile(0.5)))
+    sketch.add(3)
+    sketch.remove(3)
+    self.assertTrue(pd.isna(sketch.quantile(0.5)))
+
+
+class TrendStoreTest(unittest.TestCase):
+  def survey(self, rng, user_ids):
+    return pd.DataFrame({"group": [rng.choice(["Test", "Control"]) for _ in user_ids],
+                         "nutri_score_1": [rng.randint(-10, 30) for _ in user_ids]},
+                        index=pd.Index(user_ids, name="user_id"))
+
+  def test_matches_pandas_after_participants_change(self):
+    rng = random.Random(3)
+    user_ids = [100000 + i for i in range(40)]
+    arrivals = {str(user_id): 1600000000 * 10**9 + i for i, user_id in enumerate(user_ids)}
+    survey_df = self.survey(rng, user_ids)
+    store = TrendStore(["nutri_score_1"], bucket_size=10)
+    store.update(survey_df, set(arrivals), arrivals)
+
+    #some participants change their answers or group, one is deleted
+    changed = user_ids[::5]
+    survey_df.loc[changed] = self.survey(rng, changed)
+    survey_df = survey_df.drop(user_ids[-1])
+    store.update(survey_df, set(str(user_id) for user_id in changed + [user_ids[-1]]), arrivals)
+
+    for group in ["Test", "Control"]:
+      expected = survey_df[survey_df["group"] == group]["nutri_score_1"]
+      last = store.cumulative("participants", group, "nutri_score_1")[-1]
+      self.assertEqual(last["N"], len(expected))
+      self.assertAlmostEqual(last["mean"], expected.mean(), places=9)
+      self.assertAlmostEqual(last["SD"], expected.std(), places=9)
+      self.assertLessEqual(abs(last["median"] - expected.median()), RELATIVE_ACCURACY * abs(expected.median()))
+
+
+if __name__ == '__main__':
+  unittest.main()
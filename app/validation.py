@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+import pandas as pd
+
+#columns every file of a kind has to provide, the participant files
+#are checked once when they are read and the result is cached with them
+EXPECTED_COLUMNS = {
+  "machineLayout": frozenset(["BoxNr", "ProductId", "ProductNutriLabel", "ProductNutriScore"]),
+  "trackings": frozenset(["timestamp"]),
+  "task": frozenset(["t_1", "t_2", "t_3", "t_4"]),
+  "basic": frozenset(["age", "weight", "height", "gender", "diet", "education", "snack_frequency", "ar_frequency"]),
+  "evaluation": frozenset(["IE1", "IE2",
+                           "PE1", "PE2", "PE3",
+                           "EE1", "EE2", "EE3",
+                           "SI1", "SI2", "SI3",
+                           "HM1", "HM2",
+                           "PI1", "PI2", "PI3",
+                           "BI1", "BI2", "BI3",
+                           "FL1", "FL2", "FL3"]),
+  "guess": frozenset(),
+}
+
+SURVEY_KINDS = ["evaluation", "basic", "guess", "task"]
+TASK_ANSWERS = ["t_1", "t_2", "t_3", "t_4"]
+
+
+def issue(check, count, detail, filename="", kind=""):
+  return {"file": filename,
+          "kind": kind,
+          "check": check,
+          "count": int(count),
+          "detail": detail}
+
+def examples(values, n=5):
+  values = list(values)
+  text = ", ".join(str(value) for value in values[:n])
+  if len(values) > n:
+    text += ", ..."
+  return text
+
+def validate_file(filename, kind, df, categories, product_ids):
+  #checks a single participant file as read from disk, before it is merged
+  issues = []
+
+  missing = EXPECTED_COLUMNS[kind].difference(df.columns)
+  if missing:
+    issues.append(issue("missing columns", len(missing), examples(sorted(missing)), filename, kind))
+
+  if len(df) == 0:
+    issues.append(issue("empty file", 0, "no rows", filename, kind))
+    return issues
+
+  if kind == "machineLayout":
+    if "BoxNr" in df.columns:
+      box = pd.to_numeric(df["BoxNr"], errors="coerce")
+      invalid = box.isna() | (box < 1) | (box % 1 != 0)
+      if invalid.any():
+        issues.append(issue("invalid BoxNr", invalid.sum(), examples(df["BoxNr"][invalid]), filename, kind))
+      duplicated = box.duplicated() & ~invalid
+      if duplicated.any():
+        issues.append(issue("duplicate BoxNr", duplicated.sum(), examples(box[duplicated].astype(int)), filename, kind))
+    if "ProductId" in df.columns:
+      unknown = ~df["ProductId"].isin(product_ids)
+      if unknown.any():
+        issues.append(issue("ProductId not in nutris", unknown.sum(), examples(df["ProductId"][unknown].unique()), filename, kind))
+
+  if kind == "trackings" and "timestamp" in df.columns:
+    invalid = pd.to_numeric(df["timestamp"], errors="coerce").isna()
+    if invalid.any():
+      issues.append(issue("invalid timestamp", invalid.sum(), examples(df["timestamp"][invalid]), filename, kind))
+
+  if kind in SURVEY_KINDS:
+    duplicated = df.index.duplicated()
+    if duplicated.any():
+      issues.append(issue("duplicate user_id", duplicated.sum(), examples(df.index[duplicated].unique()), filename, kind))
+
+  if kind == "task":
+    for col in df.columns.intersection(TASK_ANSWERS):
+      answers = pd.to_numeric(df[col], errors="coerce")
+      invalid = df[col].notna() & (answers.isna() | (answers % 1 != 0))
+      if invalid.any():
+        issues.append(issue("invalid answer {}".format(col), invalid.sum(), examples(df[col][invalid]), filename, kind))
+
+  for col in df.columns.intersection(list(categories)):
+    mapping, as_int = categories[col]
+    values = pd.to_numeric(df[col], errors="coerce") if as_int else df[col]
+    unmapped = df[col].notna() & ~values.isin(list(mapping))
+    if unmapped.any():
+      issues.append(issue("unmapped answer {}".format(col), unmapped.sum(), examples(df[col][unmapped].unique()), filename, kind))
+
+  return issues
+
+def validate_study(files):
+  #checks across the files of one study, runs whenever one of them changed
+  issues = []
+  filenames = sorted(files)
+
+  for kind in SURVEY_KINDS:
+    indexes = [files[filename]["df"].index for filename in filenames if files[filename]["kind"] == kind]
+    if len(indexes) > 1:
+      #duplicates within one file are already reported for that file
+      per_file = pd.Index([]).append([index.astype(str).unique() for index in indexes])
+      duplicated = per_file[per_file.duplicated()].unique()
+      if len(duplicated):
+        issues.append(issue("user_id in several {} files".format(kind), len(duplicated), examples(duplicated), kind=kind))
+
+  tasks = [files[filename]["df"] for filename in filenames if files[filename]["kind"] == "task"]
+  if not tasks:
+    return issues
+  answers = pd.concat(tasks)
+  answers.index = answers.index.astype(str)
+  answers = answers[answers.columns.intersection(TASK_ANSWERS)]
+  answers.columns = [col.split("_")[1] for col in answers.columns]
+  answers = answers.rename_axis("user_id").reset_index().melt(id_vars="user_id", var_name="task", value_name="BoxNr")
+
+  trackings = [files[filename]["df"] for filename in filenames if files[filename]["kind"] == "trackings"]
+  tracked = pd.concat(trackings).reindex(columns=["user_id", "task"]) if trackings else pd.DataFrame(columns=["user_id", "task"])
+  missing = pd.MultiIndex.from_frame(answers[["user_id", "task"]]).difference(
+    pd.MultiIndex.from_frame(tracked.astype(str)))
+  if len(missing):
+    issues.append(issue("missing trackings", len(missing), examples("{} task {}".format(*pair) for pair in missing), kind="trackings"))
+
+  layouts = [files[filename]["df"] for filename in filenames if files[filename]["kind"] == "machineLayout"]
+  boxes = pd.concat(layouts).reindex(columns=["user_id", "BoxNr"]) if layouts else pd.DataFrame(columns=["user_id", "BoxNr"])
+  boxes = boxes.assign(BoxNr=pd.to_numeric(boxes["BoxNr"], errors="coerce")).drop_duplicates()
+  answers = answers.assign(BoxNr=pd.to_numeric(answers["BoxNr"], errors="coerce")).dropna(subset=["BoxNr"])
+  matched = answers.merge(boxes, on=["user_id", "BoxNr"], how="left", indicator=True)
+  unmatched = matched[matched["_merge"] == "left_only"]
+  if len(unmatched):
+    issues.append(issue("answer without box in machine layout", len(unmatched),
+                        examples("{} task {} box {:g}".format(*row) for row in unmatched[["user_id", "task", "BoxNr"]].itertuples(index=False)),
+                        kind="task"))
+
+  return issues